@@ -1,17 +1,39 @@
-import json
 import os
+import logging
 import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
 
 import db
-from scraper import scrape_company_roles
-from scorer import score_roles_batch
+import cache
+from scraper import scrape_all_companies
+from scorer import score_roles_batch, scoring_failed
 from config import SCORE_THRESHOLD
 
-app = FastAPI(title="Role Tracker API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Prepare the database when the serving process starts, not on every import."""
+    # Migrations normally run once per deploy (migrate.py); only apply them here if that was skipped
+    if not db.assert_schema():
+        logger.warning("Database schema missing or out of date - applying migrations...")
+        db.apply_migrations()
+
+    companies_file = os.path.join(os.path.dirname(__file__), "companies.json")
+    if os.path.exists(companies_file) and db.seed_companies(companies_file):
+        logger.info("Companies seeded from companies.json")
+    yield
+
+
+app = FastAPI(title="Role Tracker API", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Allow Lovable frontend (and localhost dev) to connect
 app.add_middleware(
@@ -22,8 +44,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Track scrape status in memory
-_scrape_status = {"is_running": False, "current_company": None, "progress": ""}
+# Compress larger JSON payloads (role lists); small responses aren't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Track scrape status in memory; companies are scraped in parallel, so guard updates
+_scrape_status = {"is_running": False, "current_company": None, "active_companies": [], "progress": ""}
+_status_lock = threading.Lock()
+
+
+def _set_status(**fields):
+    """Update scrape status keys in place - the dict is never rebound."""
+    with _status_lock:
+        _scrape_status.update(fields)
 
 
 class CompanyCreate(BaseModel):
@@ -35,45 +67,55 @@ class RoleStatusUpdate(BaseModel):
     status: str  # "applied" or "dismissed"
 
 
+# Endpoints that don't block (health checks, cache hits, in-memory status) are async so they're
+# served on the event loop; DB work is pushed to the threadpool, bounded by db's connection pool.
+# The cached read endpoints return ORJSONResponse themselves: FastAPI runs jsonable_encoder over
+# any other return value, even with ORJSONResponse as the default class, so returning the
+# response skips that pass and the cache holds the encoded bytes.
+
 # --- Health Check (required for Render deploy) ---
 
 @app.get("/")
-def root():
+async def root():
     return {"status": "ok", "service": "role-tracker-api"}
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 # --- Dashboard ---
 
 @app.get("/api/stats")
-def get_stats():
-    return db.get_dashboard_stats()
+@cache.cached()
+async def get_stats():
+    return ORJSONResponse(await run_in_threadpool(db.get_dashboard_stats, SCORE_THRESHOLD))
 
 
 # --- Companies ---
 
 @app.get("/api/companies")
-def list_companies():
-    companies = db.get_all_companies()
+@cache.cached()
+async def list_companies():
+    companies = await run_in_threadpool(db.get_all_companies)
     for c in companies:
         if "last_scraped_at" in c:
             c["last_scraped"] = c.pop("last_scraped_at")
-    return companies
+    return ORJSONResponse(companies)
 
 
 @app.post("/api/companies")
 def add_company(company: CompanyCreate):
     db.add_company(company.name, company.careers_url)
+    cache.clear()
     return {"message": f"Added {company.name}"}
 
 
 @app.delete("/api/companies/{company_id}")
 def deactivate_company(company_id: int):
     db.remove_company(company_id)
+    cache.clear()
     return {"message": "Company deactivated"}
 
 
@@ -85,12 +127,9 @@ def _normalize_role(role):
         role["company"] = role.pop("company_name")
     if "first_seen_at" in role:
         role["created_at"] = role.pop("first_seen_at")
-    # Parse score_breakdown from JSON string if needed
-    if isinstance(role.get("score_breakdown"), str):
-        try:
-            role["score_breakdown"] = json.loads(role["score_breakdown"])
-        except (json.JSONDecodeError, TypeError):
-            role["score_breakdown"] = {}
+    # score_breakdown is JSONB, so it already arrives as a dict
+    if role.get("score_breakdown") is None:
+        role["score_breakdown"] = {}
     return role
 
 
@@ -106,14 +145,23 @@ def _normalize_history(entry):
 
 
 @app.get("/api/roles")
-def list_roles(qualified_only: bool = True, company_id: Optional[int] = None):
+@cache.cached()
+async def list_roles(qualified_only: bool = True, company_id: Optional[int] = None):
     if company_id:
-        roles = db.get_roles_by_company(company_id)
+        roles = await run_in_threadpool(db.get_roles_by_company, company_id)
     elif qualified_only:
-        roles = db.get_qualified_roles(SCORE_THRESHOLD)
+        roles = await run_in_threadpool(db.get_qualified_roles, SCORE_THRESHOLD)
     else:
-        roles = db.get_all_roles()
-    return [_normalize_role(r) for r in roles]
+        roles = await run_in_threadpool(db.get_all_roles)
+    return ORJSONResponse([_normalize_role(r) for r in roles])
+
+
+@app.get("/api/roles/{role_id}")
+def get_role(role_id: int):
+    role = db.get_role_detail(role_id)
+    if role is None:
+        raise HTTPException(status_code=404, detail="Role not found")
+    return _normalize_role(role)
 
 
 @app.patch("/api/roles/{role_id}")
@@ -124,65 +172,76 @@ def update_role_status(role_id: int, update: RoleStatusUpdate):
         db.mark_role_dismissed(role_id)
     else:
         raise HTTPException(status_code=400, detail="Status must be 'applied' or 'dismissed'")
+    cache.clear()
     return {"message": f"Role {role_id} marked as {update.status}"}
 
 
 # --- Scraping ---
 
-def _run_scrape(company_ids=None):
-    """Background scrape task."""
-    global _scrape_status
-    _scrape_status["is_running"] = True
-
-    companies = db.get_active_companies()
-    if company_ids:
-        companies = [c for c in companies if c["id"] in company_ids]
-
-    for company in companies:
+def _persist_company(company, roles):
+    """scrape_all_companies sink: score and persist one company's scraped roles."""
+    with _status_lock:
+        _scrape_status["active_companies"].append(company["name"])
         _scrape_status["current_company"] = company["name"]
-        _scrape_status["progress"] = f"Scraping {company['name']}..."
+        _scrape_status["progress"] = f"Scoring {len(roles)} roles from {company['name']}..."
+
+    try:
+        scored = score_roles_batch(roles, company["name"])
+        role_rows = []
 
-        try:
-            roles = scrape_company_roles(company["name"], company["careers_url"])
-            _scrape_status["progress"] = f"Scoring {len(roles)} roles from {company['name']}..."
+        for role, score_result in scored:
+            raw_posted = role.get("posted_date")
+            posted_date = raw_posted if raw_posted and raw_posted != "Not specified" else None
+            failed = scoring_failed(score_result)
 
-            scored = score_roles_batch(roles, company["name"])
-            qualified_count = 0
+            role_rows.append({
+                "title": role.get("title", "Unknown"),
+                "url": role.get("url", ""),
+                "location": role.get("location", ""),
+                "description": role.get("description", ""),
+                "seniority": role.get("seniority", ""),
+                "department": role.get("department", ""),
+                # None = not scored this run; the upsert then keeps the role's previous score
+                "score": None if failed else score_result.get("total_score", 0),
+                "score_breakdown": None if failed else score_result.get("breakdown", {}),
+                "posted_date": posted_date,
+            })
 
-            for role, score_result in scored:
-                total_score = score_result.get("total_score", 0)
-                if total_score >= SCORE_THRESHOLD:
-                    qualified_count += 1
+        db.persist_scrape_results(company["id"], role_rows, SCORE_THRESHOLD)
 
-                raw_posted = role.get("posted_date")
-                posted_date = raw_posted if raw_posted and raw_posted != "Not specified" else None
+    finally:
+        with _status_lock:
+            _scrape_status["active_companies"].remove(company["name"])
 
-                db.upsert_role(
-                    company_id=company["id"],
-                    title=role.get("title", "Unknown"),
-                    url=role.get("url", ""),
-                    location=role.get("location", ""),
-                    description=role.get("description", ""),
-                    seniority=role.get("seniority", ""),
-                    department=role.get("department", ""),
-                    score=total_score,
-                    score_breakdown=score_result.get("breakdown", {}),
-                    posted_date=posted_date
-                )
 
-            db.update_company_scraped(company["id"])
-            db.log_scrape(company["id"], len(roles), qualified_count, "completed")
+def _run_scrape(company_ids=None):
+    """Background scrape task."""
+    _set_status(is_running=True)
 
-        except Exception as e:
-            db.log_scrape(company["id"], 0, 0, "error", str(e))
+    try:
+        companies = db.get_active_companies()
+        if company_ids:
+            companies = [c for c in companies if c["id"] in company_ids]
 
-    _scrape_status = {"is_running": False, "current_company": None, "progress": "Done"}
+        _set_status(progress=f"Scraping {len(companies)} companies...")
+        # Batched, deduplicated and parallel; each company is scored and persisted as it arrives
+        results = scrape_all_companies(companies, sink=_persist_company)
+        for outcome in results.values():
+            if outcome["error"]:
+                db.log_scrape(outcome["company"]["id"], 0, 0, "error", outcome["error"])
+    finally:
+        # Always release is_running, or a failed run would block every later scrape with a 409
+        cache.clear()
+        _set_status(is_running=False, current_company=None, active_companies=[], progress="Done")
 
 
 @app.post("/api/scrape")
 def trigger_scrape(background_tasks: BackgroundTasks, company_id: Optional[int] = None):
-    if _scrape_status["is_running"]:
-        raise HTTPException(status_code=409, detail="Scrape already in progress")
+    # Check and claim under the lock so two concurrent requests can't both start a scrape
+    with _status_lock:
+        if _scrape_status["is_running"]:
+            raise HTTPException(status_code=409, detail="Scrape already in progress")
+        _scrape_status["is_running"] = True
 
     company_ids = [company_id] if company_id else None
     background_tasks.add_task(_run_scrape, company_ids)
@@ -190,8 +249,9 @@ def trigger_scrape(background_tasks: BackgroundTasks, company_id: Optional[int]
 
 
 @app.get("/api/scrape/status")
-def scrape_status():
-    return _scrape_status
+async def scrape_status():
+    with _status_lock:
+        return {**_scrape_status, "active_companies": list(_scrape_status["active_companies"])}
 
 
 @app.get("/api/scrape/history")
@@ -0,0 +1,61 @@
+import functools
+import inspect
+import threading
+import time
+from config import RESPONSE_CACHE_TTL
+
+# In-process response cache for read endpoints. The API, background scrapes and the
+# scheduler all share one process, so a dict is enough and clear() reaches every writer.
+_entries = {}  # (func name, args, frozen kwargs) -> (expires_at, value)
+_lock = threading.Lock()
+_generation = 0  # bumped by clear() so in-flight calls don't store pre-clear results
+
+
+def _lookup(key):
+    """Return (hit, value, generation) for a cache key."""
+    with _lock:
+        entry = _entries.get(key)
+        generation = _generation
+    if entry and entry[0] > time.monotonic():
+        return True, entry[1], generation
+    return False, None, generation
+
+
+def _store(key, value, generation, ttl):
+    with _lock:
+        if generation == _generation:
+            _entries[key] = (time.monotonic() + ttl, value)
+
+
+def cached(ttl=RESPONSE_CACHE_TTL):
+    """Cache a function's return value per argument set for `ttl` seconds. Works on sync and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = (func.__name__, args, frozenset(kwargs.items()))
+                hit, value, generation = _lookup(key)
+                if not hit:
+                    value = await func(*args, **kwargs)
+                    _store(key, value, generation, ttl)
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, frozenset(kwargs.items()))
+            hit, value, generation = _lookup(key)
+            if not hit:
+                value = func(*args, **kwargs)
+                _store(key, value, generation, ttl)
+            return value
+        return wrapper
+    return decorator
+
+
+def clear():
+    """Drop every cached response. Call after anything that writes to the DB."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
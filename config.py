@@ -9,9 +9,51 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # PostgreSQL connection string (Supabase)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection pool sizing - keep DB_POOL_MAX under the Supabase pooler's client limit.
+# psycopg2 closes any returned connection beyond DB_POOL_MIN, so MIN is the number actually
+# kept open and reused; it defaults to MAX so scrape workers and API threads don't reconnect
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 20))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", DB_POOL_MAX))
+
+# Re-check pooled connections idle longer than this (seconds) - Supabase drops idle sockets
+DB_POOL_PING_AFTER = int(os.getenv("DB_POOL_PING_AFTER", 60))
+
+# Companies packed into one Perplexity request by scrape_all_companies (1 = one request per company)
+PERPLEXITY_BATCH_SIZE = int(os.getenv("PERPLEXITY_BATCH_SIZE", 4))
+
+# Concurrent Perplexity requests in scrape_all_companies - tune to the provider's concurrency limit.
+# Each worker then scores (up to GEMINI_MAX_WORKERS calls) and persists its companies
+PERPLEXITY_MAX_WORKERS = int(os.getenv("PERPLEXITY_MAX_WORKERS", 10))
+
+# Perplexity rate limits - requests and tokens (prompt + max output) per minute
+PERPLEXITY_RPM = int(os.getenv("PERPLEXITY_RPM", 50))
+PERPLEXITY_TPM = int(os.getenv("PERPLEXITY_TPM", 200000))
+
+# Output budget per company in a Perplexity request; a reply cut off at this budget is
+# retried once at PERPLEXITY_RETRY_MAX_TOKENS (sonar-pro's output limit) before it's an error
+PERPLEXITY_MAX_TOKENS = int(os.getenv("PERPLEXITY_MAX_TOKENS", 1500))
+PERPLEXITY_RETRY_MAX_TOKENS = int(os.getenv("PERPLEXITY_RETRY_MAX_TOKENS", 8000))
+
+# Perplexity (connect, read) timeouts in seconds - fail fast instead of holding a worker for minutes
+PERPLEXITY_TIMEOUT = (
+    float(os.getenv("PERPLEXITY_CONNECT_TIMEOUT", 5)),
+    float(os.getenv("PERPLEXITY_READ_TIMEOUT", 45)),
+)
+
+# Seconds a company's parsed scrape result is reused before Perplexity is asked again
+SCRAPE_CACHE_TTL = int(os.getenv("SCRAPE_CACHE_TTL", 6 * 3600))
+
+# Gemini scoring concurrency - keep within the API key's rate limit
+GEMINI_MAX_WORKERS = int(os.getenv("GEMINI_MAX_WORKERS", 12))
+GEMINI_MAX_RETRIES = 3  # retries per role on 429/5xx, with exponential backoff
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", 60))  # scoring requests per minute, shared by every scoring thread
+
 # Scoring threshold - only surface roles at or above this score
 SCORE_THRESHOLD = 80
 
+# Seconds read endpoints (/api/stats, /api/companies, /api/roles) serve from cache
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60))
+
 # Target locations (priority order)
 TARGET_LOCATIONS = ["London"]
 
@@ -1,300 +1,542 @@
+import hashlib
 import json
 import os
+import orjson
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+from contextlib import contextmanager
 from datetime import datetime
-from config import DATABASE_URL
-
-
-def get_connection():
-    conn = psycopg2.connect(DATABASE_URL)
+from psycopg2.pool import ThreadedConnectionPool
+from config import DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_PING_AFTER
+
+
+# Return TIMESTAMP columns as ISO-8601 strings straight from the wire, so rows are
+# JSON-ready without a per-cell datetime check
+_TIMESTAMP_ISO = psycopg2.extensions.new_type(
+    (1114,), "TIMESTAMP_ISO", lambda value, cur: value.replace(" ", "T", 1) if value is not None else None
+)
+psycopg2.extensions.register_type(_TIMESTAMP_ISO)
+
+# Shared connection pool - avoids a fresh TCP+TLS+auth handshake per query.
+# Cursors yield dict rows keyed by column name.
+_POOL = ThreadedConnectionPool(
+    minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, dsn=DATABASE_URL,
+    cursor_factory=psycopg2.extras.RealDictCursor
+)
+
+# ThreadedConnectionPool raises instead of blocking when exhausted, so gate
+# checkouts with a semaphore and make callers wait for a free connection
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+# id(conn) -> time it was last returned to the pool
+_last_used = {}
+
+
+def _alive(conn):
+    """Ping a connection that may have gone stale while idle."""
+    idle_for = time.monotonic() - _last_used.get(id(conn), time.monotonic())
+    if not conn.closed and idle_for <= DB_POOL_PING_AFTER:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout():
+    """
+    Take a connection from the pool, replacing it if the server dropped it while idle.
+    After an idle spell Supabase drops every pooled socket at once, so keep discarding until
+    one answers; after DB_POOL_MAX misses the idle pool is drained and getconn() opens a
+    fresh connection, which is used as is.
+    """
+    conn = _POOL.getconn()
+    for _ in range(DB_POOL_MAX):
+        if _alive(conn):
+            break
+        _last_used.pop(id(conn), None)
+        _POOL.putconn(conn, close=True)
+        conn = _POOL.getconn()
     conn.autocommit = False
     return conn
 
 
-def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS companies (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            careers_url TEXT NOT NULL,
-            active INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT NOW(),
-            last_scraped_at TIMESTAMP
-        );
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS roles (
-            id SERIAL PRIMARY KEY,
-            company_id INTEGER NOT NULL REFERENCES companies(id),
-            title TEXT NOT NULL,
-            url TEXT,
-            location TEXT,
-            description TEXT,
-            seniority TEXT,
-            department TEXT,
-            posted_date TEXT,
-            score INTEGER,
-            score_breakdown TEXT,
-            status TEXT DEFAULT 'new',
-            first_seen_at TIMESTAMP DEFAULT NOW(),
-            last_seen_at TIMESTAMP DEFAULT NOW(),
-            applied_at TIMESTAMP,
-            UNIQUE(company_id, title, location)
-        );
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS scrape_logs (
-            id SERIAL PRIMARY KEY,
-            company_id INTEGER REFERENCES companies(id),
-            started_at TIMESTAMP DEFAULT NOW(),
-            finished_at TIMESTAMP,
-            roles_found INTEGER DEFAULT 0,
-            roles_qualified INTEGER DEFAULT 0,
-            status TEXT DEFAULT 'running',
-            error TEXT
-        );
-    """)
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-def _row_to_dict(cur):
-    """Convert cursor results to list of dicts using column names."""
-    if cur.description is None:
-        return []
-    columns = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-    result = []
-    for row in rows:
-        d = {}
-        for col, val in zip(columns, row):
-            if isinstance(val, datetime):
-                d[col] = val.isoformat()
-            else:
-                d[col] = val
-        result.append(d)
-    return result
+@contextmanager
+def get_conn():
+    """Borrow a pooled connection; it is returned (and rolled back if left mid-transaction) on exit."""
+    _pool_slots.acquire()
+    try:
+        conn = _checkout()
+        try:
+            yield conn
+        finally:
+            _last_used[id(conn)] = time.monotonic()
+            _POOL.putconn(conn)
+            # The pool closes connections beyond minconn instead of keeping them; forget those
+            # (conn is still referenced here, so its id can't have been reused yet)
+            if conn.closed:
+                _last_used.pop(id(conn), None)
+    finally:
+        _pool_slots.release()
+
+
+def _json(obj):
+    """Adapt a Python object for a JSONB column, encoding with orjson."""
+    return psycopg2.extras.Json(obj, dumps=lambda o: orjson.dumps(o).decode())
+
+
+def _breakdown_json(breakdown):
+    """
+    Adapt a score breakdown for the JSONB column. Scorers may hand back a JSON string or
+    free text ("n/a"); anything that isn't a JSON object is stored as {} rather than failing
+    the company's whole write.
+    """
+    if breakdown is None:
+        return None
+    if isinstance(breakdown, str):
+        try:
+            breakdown = orjson.loads(breakdown)
+        except orjson.JSONDecodeError:
+            breakdown = {}
+    return _json(breakdown if isinstance(breakdown, dict) else {})
+
+
+# Bump whenever apply_migrations gains a step, so assert_schema notices an out-of-date DB
+SCHEMA_VERSION = "3"
+
+_MIGRATION_LOCK_ID = 74210  # pg advisory lock key, serializes concurrent apply_migrations runs
+
+
+def apply_migrations():
+    """Create or upgrade the schema. Idempotent; run once per deploy via migrate.py."""
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS companies (
+                id SERIAL PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                careers_url TEXT NOT NULL,
+                active INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT NOW(),
+                last_scraped_at TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS roles (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER NOT NULL REFERENCES companies(id),
+                title TEXT NOT NULL,
+                url TEXT,
+                location TEXT,
+                description TEXT,
+                seniority TEXT,
+                department TEXT,
+                posted_date TEXT,
+                score INTEGER,
+                score_breakdown JSONB,
+                status TEXT DEFAULT 'new',
+                first_seen_at TIMESTAMP DEFAULT NOW(),
+                last_seen_at TIMESTAMP DEFAULT NOW(),
+                applied_at TIMESTAMP,
+                UNIQUE(company_id, title, location)
+            );
+        """)
+        # Databases created before score_breakdown moved to JSONB. The TEXT column accepted
+        # anything, so values that aren't valid JSON become NULL instead of aborting the ALTER
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION pg_temp.text_to_jsonb(value TEXT) RETURNS JSONB AS $$
+            BEGIN
+                RETURN NULLIF(value, '')::jsonb;
+            EXCEPTION WHEN invalid_text_representation THEN
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql IMMUTABLE;
+        """)
+        cur.execute("""
+            DO $$
+            BEGIN
+                IF (SELECT data_type FROM information_schema.columns
+                    WHERE table_name = 'roles' AND column_name = 'score_breakdown') = 'text' THEN
+                    ALTER TABLE roles ALTER COLUMN score_breakdown TYPE JSONB
+                        USING pg_temp.text_to_jsonb(score_breakdown);
+                END IF;
+            END $$;
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_logs (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER REFERENCES companies(id),
+                started_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP,
+                roles_found INTEGER DEFAULT 0,
+                roles_qualified INTEGER DEFAULT 0,
+                status TEXT DEFAULT 'running',
+                error TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS score_cache (
+                hash TEXT PRIMARY KEY,
+                result JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_cache (
+                key TEXT PRIMARY KEY,
+                roles JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            );
+        """)
+        # Cover the role list orderings (qualified/all roles, roles by company)
+        cur.execute("CREATE INDEX IF NOT EXISTS roles_score_idx ON roles (score DESC, last_seen_at DESC);")
+        cur.execute("CREATE INDEX IF NOT EXISTS roles_company_score_idx ON roles (company_id, score DESC);")
+        # Dashboard stats are one FILTER pass over roles and never use these; drop them from older schemas
+        cur.execute("DROP INDEX IF EXISTS roles_status_score_idx;")
+        cur.execute("DROP INDEX IF EXISTS roles_new_qualified_idx;")
+        cur.execute(
+            """INSERT INTO meta (key, value) VALUES ('schema_version', %s)
+               ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value""",
+            (SCHEMA_VERSION,)
+        )
+        conn.commit()
+
 
+def assert_schema():
+    """Cheap, read-only check that migrations are applied. Returns True if the schema is current."""
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('meta') IS NOT NULL AS ready")
+        if not cur.fetchone()["ready"]:
+            return False
+        cur.execute("SELECT value FROM meta WHERE key = 'schema_version'")
+        row = cur.fetchone()
+        return row is not None and row["value"] == SCHEMA_VERSION
 
-def seed_companies(companies_file):
-    """Load companies from JSON file into DB if not already present."""
-    with open(companies_file, "r") as f:
-        companies = json.load(f)
 
-    conn = get_connection()
-    cur = conn.cursor()
-    for company in companies:
+def seed_companies(companies_file):
+    """
+    Load companies from JSON file into DB if not already present.
+    Skipped when the file's checksum matches the last seeded one. Returns True if it seeded.
+    """
+    with open(companies_file, "rb") as f:
+        raw = f.read()
+    checksum = hashlib.sha256(raw).hexdigest()
+    companies = json.loads(raw)
+
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT value FROM meta WHERE key = 'companies_json_sha256'")
+        row = cur.fetchone()
+        if row and row["value"] == checksum:
+            return False
+
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO companies (name, careers_url, active) VALUES %s ON CONFLICT (name) DO NOTHING",
+            [(c["name"], c["careers_url"], 1 if c.get("active", True) else 0) for c in companies]
+        )
         cur.execute(
-            "INSERT INTO companies (name, careers_url, active) VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING",
-            (company["name"], company["careers_url"], 1 if company.get("active", True) else 0)
+            """INSERT INTO meta (key, value) VALUES ('companies_json_sha256', %s)
+               ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value""",
+            (checksum,)
         )
-    conn.commit()
-    cur.close()
-    conn.close()
+        conn.commit()
+    return True
 
 
 def get_active_companies():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM companies WHERE active = 1")
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, name, careers_url FROM companies WHERE active = 1")
+        return cur.fetchall()
 
 
 def get_all_companies():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM companies ORDER BY name")
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, name, careers_url, active, created_at, last_scraped_at FROM companies ORDER BY name")
+        return cur.fetchall()
 
 
 def add_company(name, careers_url):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO companies (name, careers_url, active) VALUES (%s, %s, 1) ON CONFLICT (name) DO NOTHING",
-        (name, careers_url)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO companies (name, careers_url, active) VALUES (%s, %s, 1) ON CONFLICT (name) DO NOTHING",
+            (name, careers_url)
+        )
+        conn.commit()
 
 
 def remove_company(company_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE companies SET active = 0 WHERE id = %s", (company_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE companies SET active = 0 WHERE id = %s", (company_id,))
+        conn.commit()
 
 
 def upsert_role(company_id, title, url, location, description, seniority, department, score, score_breakdown, posted_date=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, status FROM roles WHERE company_id = %s AND title = %s AND location = %s",
-        (company_id, title, location)
-    )
-    existing = cur.fetchone()
-
+    upsert_roles_bulk(company_id, [{
+        "title": title,
+        "url": url,
+        "location": location,
+        "description": description,
+        "seniority": seniority,
+        "department": department,
+        "score": score,
+        "score_breakdown": score_breakdown,
+        "posted_date": posted_date,
+    }])
+
+
+def upsert_roles_bulk(company_id, roles):
+    """Insert or refresh a company's roles in one statement. Each role is a dict of upsert_role's fields."""
+    with get_conn() as conn, conn.cursor() as cur:
+        _upsert_roles(cur, company_id, roles)
+        conn.commit()
+
+
+# Roles scored this run overwrite everything; roles whose scoring failed (score None) keep
+# their previous score and breakdown, and new ones are stored with 0
+_UPSERT_SET_SCORED = """url = EXCLUDED.url, description = EXCLUDED.description,
+               seniority = EXCLUDED.seniority, department = EXCLUDED.department,
+               posted_date = EXCLUDED.posted_date, score = EXCLUDED.score,
+               score_breakdown = EXCLUDED.score_breakdown, last_seen_at = EXCLUDED.last_seen_at"""
+_UPSERT_SET_UNSCORED = """url = EXCLUDED.url, description = EXCLUDED.description,
+               seniority = EXCLUDED.seniority, department = EXCLUDED.department,
+               posted_date = EXCLUDED.posted_date, last_seen_at = EXCLUDED.last_seen_at"""
+
+
+def _upsert_roles(cur, company_id, roles, threshold=80):
+    """
+    Upsert roles on an open cursor. Returns (roles written, roles scoring >= threshold), counted by Postgres.
+    A role with score None (scoring failed) doesn't overwrite the score it already has.
+    """
     now = datetime.utcnow()
-    breakdown_json = json.dumps(score_breakdown) if isinstance(score_breakdown, dict) else score_breakdown
+    # ON CONFLICT can't touch the same row twice in one statement, so keep the last duplicate
+    scored, unscored = {}, {}
+    for role in roles:
+        key = (role["title"], role["location"])
+        breakdown_json = _breakdown_json(role.get("score_breakdown"))
+        if role.get("score") is None:
+            scored.pop(key, None)
+            unscored[key] = (
+                company_id, role["title"], role.get("url"), role["location"], role.get("description"),
+                role.get("seniority"), role.get("department"), role.get("posted_date"),
+                0, _json({}), now, now
+            )
+        else:
+            unscored.pop(key, None)
+            scored[key] = (
+                company_id, role["title"], role.get("url"), role["location"], role.get("description"),
+                role.get("seniority"), role.get("department"), role.get("posted_date"),
+                role.get("score"), breakdown_json, now, now
+            )
+
+    total = qualified = 0
+    for rows, set_clause in ((scored, _UPSERT_SET_SCORED), (unscored, _UPSERT_SET_UNSCORED)):
+        if not rows:
+            continue
+        # execute_values only takes the VALUES placeholder, so the (integer) threshold is inlined
+        counts = psycopg2.extras.execute_values(
+            cur,
+            f"""WITH upserted AS (
+               INSERT INTO roles (company_id, title, url, location, description, seniority,
+               department, posted_date, score, score_breakdown, first_seen_at, last_seen_at)
+               VALUES %s
+               ON CONFLICT (company_id, title, location) DO UPDATE SET
+               {set_clause}
+               RETURNING score
+               )
+               SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE score >= {int(threshold)}) AS qualified
+               FROM upserted""",
+            list(rows.values()),
+            page_size=500,
+            fetch=True
+        )
+        # One count row per page of 500
+        total += sum(c["total"] for c in counts)
+        qualified += sum(c["qualified"] for c in counts)
+    return total, qualified
+
+
+def persist_scrape_results(company_id, role_rows, threshold=80):
+    """
+    Write a company's scraped roles, last_scraped_at and scrape log in a single transaction.
+    Returns (roles_found, roles_qualified) as logged.
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        total_count, qualified_count = _upsert_roles(cur, company_id, role_rows, threshold)
+        cur.execute(
+            "UPDATE companies SET last_scraped_at = NOW() WHERE id = %s",
+            (company_id,)
+        )
+        cur.execute(
+            """INSERT INTO scrape_logs (company_id, finished_at, roles_found, roles_qualified, status)
+               VALUES (%s, NOW(), %s, %s, 'completed')""",
+            (company_id, total_count, qualified_count)
+        )
+        conn.commit()
+    return total_count, qualified_count
+
+
+def get_cached_scores(hashes):
+    """Return {hash: score_result} for the hashes already in score_cache."""
+    if not hashes:
+        return {}
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT hash, result FROM score_cache WHERE hash = ANY(%s)", (list(hashes),))
+        return {row["hash"]: row["result"] for row in cur.fetchall()}
+
+
+def save_cached_scores(results):
+    """Store {hash: score_result} in score_cache, overwriting existing entries."""
+    if not results:
+        return
+    with get_conn() as conn, conn.cursor() as cur:
+        psycopg2.extras.execute_values(
+            cur,
+            """INSERT INTO score_cache (hash, result) VALUES %s
+               ON CONFLICT (hash) DO UPDATE SET result = EXCLUDED.result, created_at = NOW()""",
+            [(h, _json(result)) for h, result in results.items()]
+        )
+        conn.commit()
 
-    if existing:
+
+def get_cached_scrape(key, max_age_seconds):
+    """Return the cached role list for a scrape key if younger than max_age_seconds, else None."""
+    with get_conn() as conn, conn.cursor() as cur:
         cur.execute(
-            """UPDATE roles SET url = %s, description = %s, seniority = %s, department = %s,
-               posted_date = %s, score = %s, score_breakdown = %s, last_seen_at = %s WHERE id = %s""",
-            (url, description, seniority, department, posted_date, score,
-             breakdown_json, now, existing[0])
+            """SELECT roles FROM scrape_cache
+               WHERE key = %s AND created_at > NOW() - %s * INTERVAL '1 second'""",
+            (key, max_age_seconds)
         )
-    else:
+        row = cur.fetchone()
+    return row["roles"] if row else None
+
+
+def save_cached_scrape(key, roles):
+    with get_conn() as conn, conn.cursor() as cur:
         cur.execute(
-            """INSERT INTO roles (company_id, title, url, location, description, seniority,
-               department, posted_date, score, score_breakdown, first_seen_at, last_seen_at)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-            (company_id, title, url, location, description, seniority, department, posted_date,
-             score, breakdown_json, now, now)
+            """INSERT INTO scrape_cache (key, roles) VALUES (%s, %s)
+               ON CONFLICT (key) DO UPDATE SET roles = EXCLUDED.roles, created_at = NOW()""",
+            (key, _json(roles))
         )
+        conn.commit()
+
 
-    conn.commit()
-    cur.close()
-    conn.close()
+# List views leave out the (potentially long) description - fetch it via get_role_detail
+_ROLE_LIST_COLUMNS = """r.id, r.company_id, r.title, r.url, r.location, r.seniority, r.department,
+                      r.posted_date, r.score, r.score_breakdown, r.status, r.first_seen_at,
+                      r.last_seen_at, r.applied_at"""
 
 
 def get_qualified_roles(threshold=80):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """SELECT r.*, c.name as company_name, c.careers_url
-           FROM roles r JOIN companies c ON r.company_id = c.id
-           WHERE r.score >= %s ORDER BY r.score DESC, r.last_seen_at DESC""",
-        (threshold,)
-    )
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT {_ROLE_LIST_COLUMNS}, c.name as company_name, c.careers_url
+               FROM roles r JOIN companies c ON r.company_id = c.id
+               WHERE r.score >= %s ORDER BY r.score DESC, r.last_seen_at DESC""",
+            (threshold,)
+        )
+        return cur.fetchall()
 
 
 def get_all_roles():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """SELECT r.*, c.name as company_name, c.careers_url
-           FROM roles r JOIN companies c ON r.company_id = c.id
-           ORDER BY r.score DESC, r.last_seen_at DESC"""
-    )
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT {_ROLE_LIST_COLUMNS}, c.name as company_name, c.careers_url
+               FROM roles r JOIN companies c ON r.company_id = c.id
+               ORDER BY r.score DESC, r.last_seen_at DESC"""
+        )
+        return cur.fetchall()
 
 
 def get_roles_by_company(company_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """SELECT r.*, c.name as company_name
-           FROM roles r JOIN companies c ON r.company_id = c.id
-           WHERE r.company_id = %s ORDER BY r.score DESC""",
-        (company_id,)
-    )
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""SELECT {_ROLE_LIST_COLUMNS}, c.name as company_name
+               FROM roles r JOIN companies c ON r.company_id = c.id
+               WHERE r.company_id = %s ORDER BY r.score DESC""",
+            (company_id,)
+        )
+        return cur.fetchall()
+
+
+def get_role_detail(role_id):
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """SELECT r.*, c.name as company_name, c.careers_url
+               FROM roles r JOIN companies c ON r.company_id = c.id
+               WHERE r.id = %s""",
+            (role_id,)
+        )
+        return cur.fetchone()
 
 
 def mark_role_applied(role_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE roles SET status = 'applied', applied_at = NOW() WHERE id = %s",
-        (role_id,)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE roles SET status = 'applied', applied_at = NOW() WHERE id = %s",
+            (role_id,)
+        )
+        conn.commit()
 
 
 def mark_role_dismissed(role_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE roles SET status = 'dismissed' WHERE id = %s", (role_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE roles SET status = 'dismissed' WHERE id = %s", (role_id,))
+        conn.commit()
 
 
 def update_company_scraped(company_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE companies SET last_scraped_at = NOW() WHERE id = %s",
-        (company_id,)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE companies SET last_scraped_at = NOW() WHERE id = %s",
+            (company_id,)
+        )
+        conn.commit()
 
 
 def log_scrape(company_id, roles_found=0, roles_qualified=0, status="completed", error=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """INSERT INTO scrape_logs (company_id, finished_at, roles_found, roles_qualified, status, error)
-           VALUES (%s, NOW(), %s, %s, %s, %s)""",
-        (company_id, roles_found, roles_qualified, status, error)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """INSERT INTO scrape_logs (company_id, finished_at, roles_found, roles_qualified, status, error)
+               VALUES (%s, NOW(), %s, %s, %s, %s)""",
+            (company_id, roles_found, roles_qualified, status, error)
+        )
+        conn.commit()
 
 
 def get_scrape_history(limit=20):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """SELECT sl.*, c.name as company_name FROM scrape_logs sl
-           JOIN companies c ON sl.company_id = c.id
-           ORDER BY sl.started_at DESC LIMIT %s""",
-        (limit,)
-    )
-    rows = _row_to_dict(cur)
-    cur.close()
-    conn.close()
-    return rows
-
-
-def get_dashboard_stats():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM companies WHERE active = 1")
-    total_companies = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM roles")
-    total_roles = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM roles WHERE score >= 80")
-    qualified_roles = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM roles WHERE status = 'applied'")
-    applied_roles = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM roles WHERE status = 'new' AND score >= 80")
-    new_roles = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return {
-        "total_companies": total_companies,
-        "total_roles": total_roles,
-        "qualified_roles": qualified_roles,
-        "applied_roles": applied_roles,
-        "new_roles": new_roles,
-    }
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """SELECT sl.id, sl.company_id, sl.started_at, sl.finished_at, sl.roles_found,
+                      sl.roles_qualified, sl.status, sl.error, c.name as company_name
+               FROM scrape_logs sl
+               JOIN companies c ON sl.company_id = c.id
+               ORDER BY sl.started_at DESC LIMIT %s""",
+            (limit,)
+        )
+        return cur.fetchall()
+
+
+def get_dashboard_stats(threshold=80):
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """SELECT (SELECT COUNT(*) FROM companies WHERE active = 1) AS total_companies,
+                      COUNT(*) AS total_roles,
+                      COUNT(*) FILTER (WHERE score >= %s) AS qualified_roles,
+                      COUNT(*) FILTER (WHERE status = 'applied') AS applied_roles,
+                      COUNT(*) FILTER (WHERE status = 'new' AND score >= %s) AS new_roles
+               FROM roles""",
+            (threshold, threshold)
+        )
+        return dict(cur.fetchone())
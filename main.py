@@ -7,7 +7,6 @@ from contextlib import asynccontextmanager
 # Ensure backend directory is on the path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from db import init_db, seed_companies
 from scheduler import start_scheduler, stop_scheduler
 from api import app
 from config import PORT
@@ -19,14 +18,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# Run init once at module level (safe across reloads)
-logger.info("Initializing database...")
-init_db()
-
-companies_file = os.path.join(os.path.dirname(__file__), "companies.json")
-if os.path.exists(companies_file):
-    seed_companies(companies_file)
-    logger.info("Companies seeded from companies.json")
+# Database init and company seeding run in the app's lifespan handler (see api.py)
 
 # Only start scheduler in the worker process, not the reloader
 if os.environ.get("_ROLE_TRACKER_SCHEDULER") != "1":
@@ -0,0 +1,22 @@
+"""
+Apply database migrations. Runs once per deploy, before the web service starts
+(Render preDeployCommand), so app workers only need a cheap schema check on boot.
+
+Usage:
+    python migrate.py
+"""
+import logging
+
+from db import apply_migrations, SCHEMA_VERSION
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    logger.info("Applying database migrations...")
+    apply_migrations()
+    logger.info(f"Database schema is at version {SCHEMA_VERSION}")
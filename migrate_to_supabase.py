@@ -6,6 +6,8 @@ Usage:
     2. Run: python migrate_to_supabase.py
 """
 import sqlite3
+import csv
+import io
 import json
 import os
 import psycopg2
@@ -52,25 +54,45 @@ pg_conn.commit()
 print(f"  Done. ID mapping: {company_id_map}")
 
 # --- Migrate roles ---
+ROLE_COLUMNS = ("company_id, title, url, location, description, seniority, department, posted_date, "
+                "score, score_breakdown, status, first_seen_at, last_seen_at, applied_at")
+
+def jsonb_text(value):
+    """score_breakdown was free TEXT in SQLite; copy only valid JSON (anything else as NULL) into JSONB."""
+    if not value:
+        return None
+    try:
+        json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+
 roles = sqlite_conn.execute("SELECT * FROM roles").fetchall()
 print(f"Migrating {len(roles)} roles...")
 
+buf = io.StringIO()
+writer = csv.writer(buf, quoting=csv.QUOTE_NOTNULL, lineterminator="\n")  # unquoted empty field = NULL for COPY
 for r in roles:
     new_company_id = company_id_map.get(r["company_id"])
     if not new_company_id:
         print(f"  Skipping role '{r['title']}' - no matching company")
         continue
 
-    pg_cur.execute(
-        """INSERT INTO roles (company_id, title, url, location, description, seniority,
-           department, posted_date, score, score_breakdown, status, first_seen_at, last_seen_at, applied_at)
-           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-           ON CONFLICT (company_id, title, location) DO NOTHING""",
-        (new_company_id, r["title"], r["url"], r["location"], r["description"],
-         r["seniority"], r["department"], r["posted_date"], r["score"],
-         r["score_breakdown"], r["status"], r["first_seen_at"], r["last_seen_at"],
-         r["applied_at"])
-    )
+    writer.writerow((new_company_id, r["title"], r["url"], r["location"], r["description"],
+                     r["seniority"], r["department"], r["posted_date"], r["score"],
+                     jsonb_text(r["score_breakdown"]), r["status"], r["first_seen_at"], r["last_seen_at"],
+                     r["applied_at"]))
+buf.seek(0)
+
+# COPY can't skip conflicts, so stage into a temp table and merge with ON CONFLICT DO NOTHING
+pg_cur.execute(f"CREATE TEMP TABLE roles_import ON COMMIT DROP AS SELECT {ROLE_COLUMNS} FROM roles WITH NO DATA")
+pg_cur.copy_expert(f"COPY roles_import ({ROLE_COLUMNS}) FROM STDIN WITH (FORMAT csv)", buf)
+pg_cur.execute(
+    f"""INSERT INTO roles ({ROLE_COLUMNS})
+        SELECT {ROLE_COLUMNS} FROM roles_import
+        ON CONFLICT (company_id, title, location) DO NOTHING"""
+)
 
 pg_conn.commit()
 print("  Done.")
@@ -79,17 +101,22 @@ print("  Done.")
 logs = sqlite_conn.execute("SELECT * FROM scrape_logs").fetchall()
 print(f"Migrating {len(logs)} scrape logs...")
 
+buf = io.StringIO()
+writer = csv.writer(buf, quoting=csv.QUOTE_NOTNULL, lineterminator="\n")
 for log in logs:
     new_company_id = company_id_map.get(log["company_id"])
     if not new_company_id:
         continue
 
-    pg_cur.execute(
-        """INSERT INTO scrape_logs (company_id, started_at, finished_at, roles_found, roles_qualified, status, error)
-           VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-        (new_company_id, log["started_at"], log["finished_at"], log["roles_found"],
-         log["roles_qualified"], log["status"], log["error"])
-    )
+    writer.writerow((new_company_id, log["started_at"], log["finished_at"], log["roles_found"],
+                     log["roles_qualified"], log["status"], log["error"]))
+buf.seek(0)
+
+pg_cur.copy_expert(
+    """COPY scrape_logs (company_id, started_at, finished_at, roles_found, roles_qualified, status, error)
+       FROM STDIN WITH (FORMAT csv)""",
+    buf
+)
 
 pg_conn.commit()
 print("  Done.")
@@ -0,0 +1,56 @@
+import random
+import threading
+import time
+from urllib3.util.retry import Retry
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute` tokens per minute.
+    acquire() blocks until enough tokens are available, so callers self-throttle to a
+    provider's RPM/TPM budget instead of running into 429s.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self._rate = per_minute / 60.0  # tokens per second
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        # A request bigger than the whole bucket could never be satisfied; let it drain the bucket
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def consume(self, tokens):
+        """Debit (or credit, if negative) tokens without blocking, e.g. to correct an estimate."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - tokens)
+
+
+class BackoffRetry(Retry):
+    """
+    urllib3 Retry that also backs off before the first retry. Stock Retry returns 0 from
+    get_backoff_time() until the second consecutive error, so a 5xx without Retry-After is
+    resent immediately; here retry n waits backoff_factor * 2**(n-1) plus jitter.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff == 0 and self.history:
+            backoff = min(self.backoff_max, self.backoff_factor + random.random() * self.backoff_jitter)
+        return backoff
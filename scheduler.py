@@ -2,8 +2,9 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from config import SCRAPE_HOUR, SCRAPE_MINUTE
 import db
-from scraper import scrape_company_roles
-from scorer import score_roles_batch
+import cache
+from scraper import scrape_all_companies
+from scorer import score_roles_batch, scoring_failed
 from config import SCORE_THRESHOLD
 import logging
 
@@ -12,45 +13,44 @@ logger = logging.getLogger(__name__)
 scheduler = BackgroundScheduler()
 
 
-def scheduled_scrape():
-    """Run a full scrape of all active companies. Called by the scheduler."""
-    logger.info("Scheduled scrape starting...")
-    companies = db.get_active_companies()
+def _persist_company(company, roles):
+    """scrape_all_companies sink: score and persist one company's scraped roles."""
+    logger.info(f"Found {len(roles)} roles at {company['name']}, scoring...")
 
-    for company in companies:
-        try:
-            logger.info(f"Scraping {company['name']}...")
-            roles = scrape_company_roles(company["name"], company["careers_url"])
-            logger.info(f"Found {len(roles)} roles at {company['name']}, scoring...")
+    scored = score_roles_batch(roles, company["name"])
+    role_rows = []
 
-            scored = score_roles_batch(roles, company["name"])
-            qualified_count = 0
+    for role, score_result in scored:
+        failed = scoring_failed(score_result)
+        role_rows.append({
+            "title": role.get("title", "Unknown"),
+            "url": role.get("url", ""),
+            "location": role.get("location", ""),
+            "description": role.get("description", ""),
+            "seniority": role.get("seniority", ""),
+            "department": role.get("department", ""),
+            # None = not scored this run; the upsert then keeps the role's previous score
+            "score": None if failed else score_result.get("total_score", 0),
+            "score_breakdown": None if failed else score_result.get("breakdown", {})
+        })
 
-            for role, score_result in scored:
-                total_score = score_result.get("total_score", 0)
-                if total_score >= SCORE_THRESHOLD:
-                    qualified_count += 1
+    found, qualified = db.persist_scrape_results(company["id"], role_rows, SCORE_THRESHOLD)
+    logger.info(f"Done: {company['name']} - {qualified}/{found} qualified")
 
-                db.upsert_role(
-                    company_id=company["id"],
-                    title=role.get("title", "Unknown"),
-                    url=role.get("url", ""),
-                    location=role.get("location", ""),
-                    description=role.get("description", ""),
-                    seniority=role.get("seniority", ""),
-                    department=role.get("department", ""),
-                    score=total_score,
-                    score_breakdown=score_result.get("breakdown", {})
-                )
 
-            db.update_company_scraped(company["id"])
-            db.log_scrape(company["id"], len(roles), qualified_count, "completed")
-            logger.info(f"Done: {company['name']} - {qualified_count}/{len(roles)} qualified")
+def scheduled_scrape():
+    """Run a full scrape of all active companies. Called by the scheduler."""
+    logger.info("Scheduled scrape starting...")
+    companies = db.get_active_companies()
 
-        except Exception as e:
-            logger.error(f"Error scraping {company['name']}: {e}")
-            db.log_scrape(company["id"], 0, 0, "error", str(e))
+    # The daily run is the full refresh; the cache only serves manual re-runs in between
+    results = scrape_all_companies(companies, force_refresh=True, sink=_persist_company)
+    for outcome in results.values():
+        if outcome["error"]:
+            logger.error(f"Error scraping {outcome['company']['name']}: {outcome['error']}")
+            db.log_scrape(outcome["company"]["id"], 0, 0, "error", outcome["error"])
 
+    cache.clear()
     logger.info("Scheduled scrape complete.")
 
 
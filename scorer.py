@@ -1,6 +1,12 @@
+import hashlib
 import json
+import orjson
 import requests
-from config import GEMINI_API_KEY
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import db
+from config import GEMINI_API_KEY, GEMINI_MAX_WORKERS, GEMINI_MAX_RETRIES, GEMINI_RPM, PERPLEXITY_MAX_WORKERS
+from ratelimit import BackoffRetry, TokenBucket
 
 # Load profile once at module level
 import os
@@ -8,25 +14,21 @@ _profile_path = os.path.join(os.path.dirname(__file__), "profile.json")
 with open(_profile_path, "r") as f:
     PROFILE = json.load(f)
 
+# The profile never changes at runtime, so serialize it once rather than per role
+_PROFILE_SUMMARY = json.dumps(PROFILE, indent=2)
 
-def score_role(role_title, role_description, role_location, role_seniority, company_name):
-    """
-    Use Gemini API to score a role against the candidate profile.
-    Returns: {total_score: int, breakdown: dict, recommendation: str, reasoning: str}
-    """
-    profile_summary = json.dumps(PROFILE, indent=2)
-
-    prompt = f"""You are an expert career advisor evaluating job fit for a candidate.
+# Scoring prompt - only the job fields vary between calls
+_PROMPT_TEMPLATE = """You are an expert career advisor evaluating job fit for a candidate.
 
 CANDIDATE PROFILE:
-{profile_summary}
+{profile}
 
 JOB TO EVALUATE:
-- Company: {company_name}
-- Title: {role_title}
-- Location: {role_location}
-- Seniority: {role_seniority}
-- Description: {role_description}
+- Company: {company}
+- Title: {title}
+- Location: {location}
+- Seniority: {seniority}
+- Description: {description}
 
 SCORING FRAMEWORK (100 points total):
 1. Hard Requirements (25 pts): Does the candidate meet experience years, visa/work authorization, required certifications, education requirements?
@@ -60,7 +62,46 @@ Return ONLY a JSON object with:
   "reasoning": "<2-3 sentence explanation of the score>"
 }}"""
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-pro-preview:generateContent?key={GEMINI_API_KEY}"
+# Changes to the profile or prompt invalidate every cached score
+_PROFILE_VERSION = hashlib.sha1((_PROFILE_SUMMARY + _PROMPT_TEMPLATE).encode()).hexdigest()
+
+_GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-pro-preview:generateContent?key={GEMINI_API_KEY}"
+
+# Shared session so parallel scoring reuses keep-alive connections to Gemini. The pool is
+# sized for every scoring thread across parallel company scrapes; rate limits and transient
+# server errors are retried with backoff (honouring Retry-After). Read timeouts aren't retried,
+# since the POST may already have been processed.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=GEMINI_MAX_WORKERS * PERPLEXITY_MAX_WORKERS,
+    max_retries=BackoffRetry(
+        total=GEMINI_MAX_RETRIES,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False
+    )
+))
+
+# Every scoring thread (across parallel company scrapes) draws from one Gemini RPM budget
+_request_limiter = TokenBucket(GEMINI_RPM)
+
+
+def score_role(role_title, role_description, role_location, role_seniority, company_name):
+    """
+    Use Gemini API to score a role against the candidate profile.
+    Returns: {total_score: int, breakdown: dict, recommendation: str, reasoning: str}
+    """
+    prompt = _PROMPT_TEMPLATE.format(
+        profile=_PROFILE_SUMMARY,
+        company=company_name,
+        title=role_title,
+        location=role_location,
+        seniority=role_seniority,
+        description=role_description
+    )
 
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
@@ -70,16 +111,20 @@ Return ONLY a JSON object with:
         }
     }
 
-    response = requests.post(url, json=payload, timeout=30)
+    _request_limiter.acquire()
+    response = _SESSION.post(_GEMINI_URL, json=payload, timeout=30)
     response.raise_for_status()
 
-    content = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+    envelope = orjson.loads(response.content)
+    content = envelope["candidates"][0]["content"]["parts"][0]["text"]
 
     # Parse JSON from response
     content = content.strip()
     if content.startswith("```"):
-        lines = content.split("\n")
-        content = "\n".join(lines[1:-1])
+        # Drop the opening fence line (```json) and the closing fence with a single slice
+        nl = content.find("\n")
+        end = content.rfind("```")
+        content = content[nl + 1:end].strip() if nl != -1 and end > nl else content
 
     try:
         result = json.loads(content)
@@ -100,25 +145,61 @@ Return ONLY a JSON object with:
     return result
 
 
+def scoring_failed(result):
+    """True for the zero-score placeholder returned when a role couldn't be scored."""
+    return result.get("recommendation") == "Error"
+
+
+def _safe_score(role, company_name):
+    """Score a single role, turning any failure into a zero-score result (see scoring_failed)."""
+    try:
+        return score_role(
+            role_title=role.get("title", ""),
+            role_description=role.get("description", ""),
+            role_location=role.get("location", ""),
+            role_seniority=role.get("seniority", ""),
+            company_name=company_name
+        )
+    except Exception as e:
+        return {
+            "total_score": 0,
+            "breakdown": {},
+            "red_flags": [f"Scoring error: {str(e)}"],
+            "recommendation": "Error",
+            "reasoning": f"Error during scoring: {str(e)}"
+        }
+
+
+def _score_hash(role, company_name):
+    """Key a role's score on everything that feeds the prompt."""
+    key = "|".join((
+        str(role.get("title", "")), str(role.get("description", "")), str(role.get("location", "")),
+        str(role.get("seniority", "")), company_name, _PROFILE_VERSION
+    ))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
 def score_roles_batch(roles, company_name):
-    """Score a batch of roles. Returns list of (role, score_result) tuples."""
-    scored = []
-    for role in roles:
-        try:
-            result = score_role(
-                role_title=role.get("title", ""),
-                role_description=role.get("description", ""),
-                role_location=role.get("location", ""),
-                role_seniority=role.get("seniority", ""),
-                company_name=company_name
-            )
-            scored.append((role, result))
-        except Exception as e:
-            scored.append((role, {
-                "total_score": 0,
-                "breakdown": {},
-                "red_flags": [f"Scoring error: {str(e)}"],
-                "recommendation": "Error",
-                "reasoning": f"Error during scoring: {str(e)}"
-            }))
-    return scored
+    """
+    Score a batch of roles in parallel. Returns list of (role, score_result) tuples in input order.
+    Roles scored before with the same content and profile are served from score_cache.
+    """
+    if not roles:
+        return []
+
+    hashes = [_score_hash(role, company_name) for role in roles]
+    results = db.get_cached_scores(set(hashes))
+
+    misses = {}
+    for h, role in zip(hashes, roles):
+        if h not in results:
+            misses.setdefault(h, role)
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(GEMINI_MAX_WORKERS, len(misses))) as executor:
+            fresh = dict(zip(misses, executor.map(lambda role: _safe_score(role, company_name), misses.values())))
+        results.update(fresh)
+        # Don't cache failures - they should be retried on the next scrape
+        db.save_cached_scores({h: r for h, r in fresh.items() if not scoring_failed(r)})
+
+    return [(role, results[h]) for h, role in zip(hashes, roles)]
@@ -1,18 +1,51 @@
+import hashlib
 import json
+import msgspec
+import orjson
+import re
 import requests
-from config import PERPLEXITY_API_KEY, TARGET_LOCATIONS
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from config import (
+    PERPLEXITY_API_KEY, PERPLEXITY_BATCH_SIZE, PERPLEXITY_MAX_TOKENS, PERPLEXITY_MAX_WORKERS,
+    PERPLEXITY_RETRY_MAX_TOKENS, PERPLEXITY_RPM, PERPLEXITY_TIMEOUT, PERPLEXITY_TPM,
+    SCRAPE_CACHE_TTL, TARGET_LOCATIONS
+)
+from ratelimit import BackoffRetry, TokenBucket
+import db
+import logging
 
+logger = logging.getLogger(__name__)
 
-def scrape_company_roles(company_name, careers_url):
-    """
-    Use Perplexity API to search a company's careers page for relevant open roles.
-    Returns a list of role dicts: {title, url, location, description, seniority, department}
-    """
-    locations_str = ", ".join(TARGET_LOCATIONS)
+# Shared session so calls reuse keep-alive connections to Perplexity instead of a fresh
+# TCP+TLS handshake each time. Sized for the widest fan-out that calls into this module.
+# Transient 429/5xx responses are retried (3 attempts total) after 2s then 4s, plus up to 1s
+# of jitter, or after Retry-After when the server sends it; the last failure is raised.
+# Read timeouts are not retried - the request may already be generating (and billed).
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=PERPLEXITY_MAX_WORKERS,
+    max_retries=BackoffRetry(
+        total=2,
+        read=0,
+        backoff_factor=2,
+        backoff_jitter=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
 
-    prompt = f"""Search the careers/jobs page of {company_name} ({careers_url}) and find ALL currently open roles
-that match ANY of these categories:
-- Strategy (corporate strategy, business strategy, commercial strategy)
+# Shared across threads so parallel scrapes stay inside Perplexity's rate limits
+_request_limiter = TokenBucket(PERPLEXITY_RPM)
+_token_limiter = TokenBucket(PERPLEXITY_TPM)
+
+
+# Prompt pieces shared by the single-company and batched requests
+_ROLE_CATEGORIES = """- Strategy (corporate strategy, business strategy, commercial strategy)
 - Business Development
 - Product Management / Product Strategy
 - Management Consulting / Advisory
@@ -20,95 +53,367 @@ that match ANY of these categories:
 - Commercial / GTM / Go-to-Market
 - Operations Strategy
 - Partnerships
-- Chief of Staff / Founders Associate
-
-Focus on roles in these locations: {locations_str}
+- Chief of Staff / Founders Associate"""
 
-For EACH role found, return a JSON array where each element has:
-- "title": exact job title
+_ROLE_FIELDS = """- "title": exact job title
 - "url": direct link to the job posting (full URL)
 - "location": city/country listed
 - "description": 2-3 sentence summary of the role
 - "seniority": inferred seniority level (Junior/Associate/Mid/Senior/Lead/Manager/Director/VP)
 - "department": department or team name
-- "posted_date": the date when the job was posted on the careers page (in format YYYY-MM-DD if available, or "Not specified" if not found)
+- "posted_date": the date when the job was posted on the careers page (in format YYYY-MM-DD if available, or "Not specified" if not found)"""
 
-Return ONLY the JSON array, no other text. If no matching roles are found, return an empty array [].
-Be thorough; check multiple pages if the careers site has pagination.
+_ROLE_GUIDANCE = """Be thorough; check multiple pages if the careers site has pagination.
 Do NOT include engineering/software development roles unless they are specifically product management or strategy roles."""
 
-    headers = {
-        "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
-        "Content-Type": "application/json"
-    }
+_LOCATIONS_STR = ", ".join(TARGET_LOCATIONS)
 
-    payload = {
-        "model": "sonar-pro",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a job search assistant. You search company careers pages and return structured JSON data about open positions. Always return valid JSON arrays."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.1,
-        "max_tokens": 4000
-    }
+# Everything but the company is fixed at import, so calls only fill in {company}/{url}
+_COMPANY_PROMPT_TEMPLATE = f"""Search the careers/jobs page of {{company}} ({{url}}) and find ALL currently open roles
+that match ANY of these categories:
+{_ROLE_CATEGORIES}
+
+Focus on roles in these locations: {_LOCATIONS_STR}
+
+For EACH role found, return a JSON array where each element has:
+{_ROLE_FIELDS}
+
+Return ONLY the JSON array, no other text. If no matching roles are found, return an empty array [].
+{_ROLE_GUIDANCE}"""
+
+_BATCH_PROMPT_TEMPLATE = f"""Search the careers/jobs page of EACH of these companies and find ALL currently open roles
+that match ANY of the categories below:
+{{company_list}}
+
+Categories:
+{_ROLE_CATEGORIES}
+
+Focus on roles in these locations: {_LOCATIONS_STR}
+
+Describe EACH role found as an object with:
+{_ROLE_FIELDS}
+
+Return ONLY a JSON object, no other text, mapping each company name exactly as written above to
+an array of its roles. Use an empty array [] for a company with no matching roles.
+{_ROLE_GUIDANCE}"""
+
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a job search assistant. You search company careers pages and return structured JSON data about open positions. Always return valid JSON arrays."
+}
 
-    response = requests.post(
+_BATCH_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a job search assistant. You search company careers pages and return structured JSON data about open positions. Always return valid JSON objects."
+}
+
+_HEADERS = {
+    "Authorization": f"Bearer {PERPLEXITY_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+
+_DECODER = json.JSONDecoder()
+
+
+class TruncatedReply(Exception):
+    """The reply hit max_tokens, so its JSON is cut off and the role list is incomplete."""
+
+
+class Role(msgspec.Struct):
+    """
+    Schema of one role in a Perplexity reply. Only title is required; models often send null
+    or a number for the rest, so those fields accept any value and are normalised afterwards.
+    """
+    title: str
+    url: object = None
+    location: object = None
+    description: object = None
+    seniority: object = None
+    department: object = None
+    posted_date: object = None
+
+
+_ROLE_LIST = list[Role]
+
+# Value used for an optional field the model left out or sent as null
+_ROLE_DEFAULTS = {
+    "url": "",
+    "location": "",
+    "description": "",
+    "seniority": "",
+    "department": "",
+    "posted_date": None,
+}
+
+
+def _role_dict(role):
+    data = msgspec.structs.asdict(role)
+    for field, default in _ROLE_DEFAULTS.items():
+        value = data[field]
+        if value is None:
+            data[field] = default
+        elif not isinstance(value, str):
+            data[field] = str(value)
+    return data
+
+# A fenced block anywhere in the reply, for replies with prose around the fence
+_FENCE_RE = re.compile(r"```(?:json)?[ \t]*\n(.*?)\n\s*```", re.DOTALL)
+
+
+def _post_chat(payload):
+    """Send a chat completion to Perplexity within the rate limits and return the reply text."""
+    prompt = payload["messages"][-1]["content"]
+
+    # Budget = rough input estimate (~4 chars/token) plus the full output allowance
+    estimated = len(prompt) // 4 + payload["max_tokens"]
+    _request_limiter.acquire()
+    _token_limiter.acquire(estimated)
+
+    response = _SESSION.post(
         "https://api.perplexity.ai/chat/completions",
-        headers=headers,
+        headers=_HEADERS,
         json=payload,
-        timeout=60
+        timeout=PERPLEXITY_TIMEOUT
     )
     response.raise_for_status()
 
-    content = response.json()["choices"][0]["message"]["content"]
+    # Parse the envelope straight from the (already decompressed) body bytes with orjson,
+    # skipping requests' text decode + stdlib json pass
+    envelope = orjson.loads(response.content)
+
+    # Settle the estimate against what the call really used, so unused output budget goes back to the TPM bucket
+    used = (envelope.get("usage") or {}).get("total_tokens")
+    if used:
+        _token_limiter.consume(used - estimated)
+
+    choice = envelope["choices"][0]
+    if choice.get("finish_reason") == "length":
+        # Would otherwise parse as "no roles" and be reported as a clean, empty scrape
+        raise TruncatedReply(f"Perplexity reply truncated at max_tokens={payload['max_tokens']}")
+    return choice["message"]["content"]
+
+
+def _parse_json(content, expected_type):
+    """Parse a JSON list/dict from a model reply, tolerating markdown fences and surrounding text."""
+    opener, closer = ("[", "]") if expected_type is list else ("{", "}")
 
     # Parse JSON from response - handle markdown code blocks
     content = content.strip()
-    if content.startswith("```"):
-        lines = content.split("\n")
-        # Remove first line (```json) and last line (```)
-        content = "\n".join(lines[1:-1])
+    if content.startswith("```") and content.endswith("```"):
+        # Drop the opening fence line (```json) and the closing fence with a single slice
+        nl = content.find("\n")
+        end = content.rfind("```")
+        content = content[nl + 1:end].strip() if nl != -1 and end > nl else content
+    elif "```" in content:
+        # Odd-shaped reply (text before/after the fence) - fall back to the precompiled pattern
+        match = _FENCE_RE.search(content)
+        if match:
+            content = match.group(1).strip()
 
-    try:
-        roles = json.loads(content)
-        if not isinstance(roles, list):
-            roles = []
-    except json.JSONDecodeError:
-        # Try to extract JSON array from the response
-        start = content.find("[")
-        end = content.rfind("]") + 1
-        if start != -1 and end > start:
+    parsed = None
+    if content[:1] == opener and content[-1:] == closer:
+        # Clean reply - a plain (fast, orjson) parse is all that's needed
+        try:
+            parsed = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    if parsed is None:
+        # Decode in one pass from the first opener, ignoring any text after the value.
+        # orjson can't stop at the end of a value, so this uses the stdlib decoder
+        start = content.find(opener)
+        if expected_type is dict and -1 < content.find("[") < start:
+            # A top-level array: don't pick its first element out as if it were the object
+            start = -1
+        if start != -1:
             try:
-                roles = json.loads(content[start:end])
+                parsed, _ = _DECODER.raw_decode(content, start)
             except json.JSONDecodeError:
-                roles = []
-        else:
-            roles = []
+                pass
 
+    return parsed if isinstance(parsed, expected_type) else expected_type()
+
+
+def _validate_roles(items):
+    """
+    Check parsed roles against Role and return them as plain dicts. Only entries that aren't
+    objects or lack a string title are dropped; other fields are coerced to strings.
+    """
+    try:
+        # Well-formed reply - the whole list is validated in one C pass
+        roles = msgspec.convert(items, _ROLE_LIST)
+    except msgspec.ValidationError:
+        roles = []
+        for item in items:
+            try:
+                roles.append(msgspec.convert(item, Role))
+            except msgspec.ValidationError:
+                pass
+    return [_role_dict(role) for role in roles]
+
+
+def _cache_key(payload):
+    # The payload covers company, URL, locations, prompt wording and model settings
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _company_payload(company_name, careers_url):
+    prompt = _COMPANY_PROMPT_TEMPLATE.format(company=company_name, url=careers_url)
+
+    return {
+        "model": "sonar-pro",
+        "messages": [_SYSTEM_MSG, {"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "max_tokens": PERPLEXITY_MAX_TOKENS
+    }
+
+
+def scrape_company_roles(company_name, careers_url, force_refresh=False):
+    """
+    Use Perplexity API to search a company's careers page for relevant open roles.
+    Returns a list of role dicts: {title, url, location, description, seniority, department}
+    Parsed results are cached for SCRAPE_CACHE_TTL seconds; force_refresh skips the cache.
+    Raises TruncatedReply if the role list doesn't fit even the retry budget.
+    """
+    payload = _company_payload(company_name, careers_url)
+
+    cache_key = _cache_key(payload)
+    if not force_refresh:
+        cached = db.get_cached_scrape(cache_key, SCRAPE_CACHE_TTL)
+        if cached is not None:
+            return cached
+
+    try:
+        content = _post_chat(payload)
+    except TruncatedReply:
+        # A big careers page - one more try with the largest budget before giving up
+        content = _post_chat({**payload, "max_tokens": max(PERPLEXITY_RETRY_MAX_TOKENS, payload["max_tokens"])})
+    roles = _validate_roles(_parse_json(content, list))
+
+    # An empty list may just be an unparseable reply, so only cache real results
+    if roles:
+        db.save_cached_scrape(cache_key, roles)
     return roles
 
 
-def scrape_all_companies(companies):
-    """Scrape roles for a list of company dicts. Returns {company_id: [roles]}."""
+def _scrape_single(company, force_refresh):
+    """scrape_company_roles for one company of a batch, returning its error instead of raising."""
+    try:
+        return {"roles": scrape_company_roles(company["name"], company["careers_url"], force_refresh), "error": None}
+    except Exception as e:
+        return {"roles": [], "error": str(e)}
+
+
+def scrape_companies_batched(companies, force_refresh=False):
+    """
+    Scrape several companies with a single Perplexity request.
+    Returns {company_name: {"roles": [...], "error": str or None}}.
+    Cached companies are skipped; any company missing from the reply is scraped on its own, and
+    a failure there is reported for that company only. Only the batched request itself raises.
+    """
     results = {}
+    pending = []
     for company in companies:
+        cache_key = _cache_key(_company_payload(company["name"], company["careers_url"]))
+        cached = None if force_refresh else db.get_cached_scrape(cache_key, SCRAPE_CACHE_TTL)
+        if cached is not None:
+            results[company["name"]] = {"roles": cached, "error": None}
+        else:
+            pending.append((company, cache_key))
+
+    if not pending:
+        return results
+    if len(pending) == 1:
+        company, _ = pending[0]
+        results[company["name"]] = _scrape_single(company, force_refresh)
+        return results
+
+    company_list = "\n".join(f"- {c['name']} ({c['careers_url']})" for c, _ in pending)
+    prompt = _BATCH_PROMPT_TEMPLATE.format(company_list=company_list)
+
+    payload = {
+        "model": "sonar-pro",
+        "messages": [_BATCH_SYSTEM_MSG, {"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        # Shared output budget, capped at sonar-pro's output limit
+        "max_tokens": min(PERPLEXITY_MAX_TOKENS * len(pending), PERPLEXITY_RETRY_MAX_TOKENS)
+    }
+
+    try:
+        reply = _parse_json(_post_chat(payload), dict)
+    except TruncatedReply:
+        # The shared budget ran out; each company below gets its own request instead
+        logger.warning(f"Batched reply for {len(pending)} companies was truncated, scraping them one by one")
+        reply = {}
+    else:
+        if not reply:
+            logger.warning(f"Batched reply for {len(pending)} companies wasn't a JSON object, scraping them one by one")
+
+    for company, cache_key in pending:
+        roles = reply.get(company["name"])
+        if not isinstance(roles, list):
+            results[company["name"]] = _scrape_single(company, force_refresh)
+            continue
+        if roles:
+            roles = _validate_roles(roles)
+            if roles:
+                db.save_cached_scrape(cache_key, roles)
+        results[company["name"]] = {"roles": roles, "error": None}
+    return results
+
+
+def scrape_all_companies(companies, force_refresh=False, sink=None):
+    """
+    Scrape roles for a list of company dicts concurrently, PERPLEXITY_BATCH_SIZE companies
+    per request. Returns {company_id: {"company", "roles", "error"}}.
+    Companies sharing a careers_url (e.g. subsidiaries) are scraped once and the result
+    is given to each of them.
+    With a sink(company, roles) callback - e.g. one that scores the roles and writes them with
+    db.persist_scrape_results - each company's roles are handed over on the worker thread as
+    soon as its request completes, and are not kept in the returned dict, so memory stays flat
+    and a crash keeps everything already persisted. An exception from the sink is recorded as
+    that company's error.
+    """
+    results = {}
+    if not companies:
+        return results
+
+    def finish(company, roles, error):
+        if sink is None:
+            return {"company": company, "roles": roles, "error": error}
+        if error is None:
+            try:
+                sink(company, roles)
+            except Exception as e:
+                error = str(e)
+        # Only the outcome stays in memory; the roles now live wherever the sink put them
+        return {"company": company, "error": error}
+
+    # careers_url -> every company listed under it; the first one is the one scraped
+    by_url = defaultdict(list)
+    for company in companies:
+        by_url[company["careers_url"]].append(company)
+    unique = [group[0] for group in by_url.values()]
+
+    def scrape_chunk(chunk):
+        # Runs on a worker, sink included, so slow sinks (scoring, DB writes) run in parallel too
         try:
-            roles = scrape_company_roles(company["name"], company["careers_url"])
-            results[company["id"]] = {
-                "company": company,
-                "roles": roles,
-                "error": None
-            }
+            by_name = scrape_companies_batched(chunk, force_refresh)
         except Exception as e:
-            results[company["id"]] = {
-                "company": company,
-                "roles": [],
-                "error": str(e)
-            }
+            # The batched request itself failed, so nothing in the chunk was scraped
+            by_name = {c["name"]: {"roles": [], "error": str(e)} for c in chunk}
+        outcomes = []
+        for scraped in chunk:
+            entry = by_name.get(scraped["name"], {"roles": [], "error": None})
+            for company in by_url[scraped["careers_url"]]:
+                outcomes.append(finish(company, entry["roles"], entry["error"]))
+        return outcomes
+
+    size = max(1, PERPLEXITY_BATCH_SIZE)
+    chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+
+    with ThreadPoolExecutor(max_workers=min(PERPLEXITY_MAX_WORKERS, len(chunks))) as executor:
+        for future in as_completed([executor.submit(scrape_chunk, chunk) for chunk in chunks]):
+            for outcome in future.result():
+                results[outcome["company"]["id"]] = outcome
     return results
@@ -0,0 +1,83 @@
+import pytest
+
+import ratelimit
+from ratelimit import BackoffRetry, TokenBucket
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.sleep so bucket refills are deterministic."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(ratelimit.time, "sleep", fake.sleep)
+    return fake
+
+
+def test_acquire_within_budget_does_not_wait(clock):
+    bucket = TokenBucket(60)
+
+    for _ in range(60):
+        bucket.acquire()
+
+    assert clock.slept == []
+
+
+def test_acquire_waits_for_the_refill(clock):
+    bucket = TokenBucket(60)  # 1 token per second
+    bucket.acquire(60)
+
+    bucket.acquire(5)
+
+    assert sum(clock.slept) == pytest.approx(5)
+
+
+def test_oversized_acquire_drains_the_bucket_instead_of_blocking_forever(clock):
+    bucket = TokenBucket(60)
+
+    bucket.acquire(1000)
+
+    assert clock.slept == []
+    assert bucket._tokens == 0
+
+
+def test_consume_credits_back_an_overestimate(clock):
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+
+    bucket.consume(-30)
+    bucket.acquire(30)
+
+    assert clock.slept == []
+
+
+def test_consume_never_credits_past_capacity(clock):
+    bucket = TokenBucket(60)
+
+    bucket.consume(-100)
+
+    assert bucket._tokens == 60
+
+
+def test_backoff_retry_waits_before_the_first_retry():
+    retry = BackoffRetry(total=3, backoff_factor=2, backoff_jitter=0)
+
+    first = retry.increment(method="POST", url="/")
+    second = first.increment(method="POST", url="/")
+
+    assert isinstance(first, BackoffRetry)
+    assert first.get_backoff_time() == 2
+    assert second.get_backoff_time() == 4
@@ -0,0 +1,194 @@
+import importlib
+import sys
+import types
+
+import orjson
+import pytest
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    """Import scraper against an in-memory db module (the real one opens a pool at import)."""
+    fake_db = types.ModuleType("db")
+    fake_db.saved_scrapes = {}
+    fake_db.get_cached_scrape = lambda key, max_age_seconds: None
+    fake_db.save_cached_scrape = lambda key, roles: fake_db.saved_scrapes.__setitem__(key, roles)
+    monkeypatch.setitem(sys.modules, "db", fake_db)
+    monkeypatch.delitem(sys.modules, "scraper", raising=False)
+    module = importlib.import_module("scraper")
+    yield module
+    sys.modules.pop("scraper", None)
+
+
+def _role(title, **fields):
+    return {"title": title, "url": f"https://example.com/{title}", "location": "London", **fields}
+
+
+def _companies(*names, url=None):
+    return [
+        {"id": i, "name": name, "careers_url": url or f"https://{name.lower()}.example.com/careers"}
+        for i, name in enumerate(names, 1)
+    ]
+
+
+def _user_prompt(payload):
+    return payload["messages"][-1]["content"]
+
+
+# --- _parse_json ---
+
+def test_parse_json_clean_fenced_and_wrapped_replies(scraper):
+    roles = [_role("PM")]
+    body = orjson.dumps(roles).decode()
+
+    assert scraper._parse_json(body, list) == roles
+    assert scraper._parse_json(f"```json\n{body}\n```", list) == roles
+    assert scraper._parse_json(f"Here are the roles:\n```json\n{body}\n```\nGood luck!", list) == roles
+    assert scraper._parse_json(f"Found these: {body} - let me know if you need more.", list) == roles
+
+
+def test_parse_json_returns_empty_value_when_unparseable(scraper):
+    assert scraper._parse_json("No roles found.", list) == []
+    assert scraper._parse_json('[{"title": "PM", "url": ', list) == []
+    assert scraper._parse_json('{"not": "a list"}', list) == []
+
+
+def test_parse_json_does_not_read_an_array_as_an_object(scraper):
+    assert scraper._parse_json(orjson.dumps([_role("PM")]).decode(), dict) == {}
+    assert scraper._parse_json('Results:\n{"Acme": []}', dict) == {"Acme": []}
+
+
+# --- _validate_roles ---
+
+def test_null_optional_fields_keep_the_role(scraper):
+    roles = scraper._validate_roles([
+        _role("Strategy Manager", description="Own the strategy.", seniority="Manager",
+              department="Strategy", posted_date="2026-01-05"),
+        {"title": "BD Lead", "url": None, "location": "London", "seniority": 3, "posted_date": None},
+    ])
+
+    assert [r["title"] for r in roles] == ["Strategy Manager", "BD Lead"]
+    assert roles[1]["url"] == ""
+    assert roles[1]["seniority"] == "3"
+    assert roles[1]["description"] == ""
+    assert roles[1]["posted_date"] is None
+
+
+def test_entries_without_a_string_title_are_dropped(scraper):
+    roles = scraper._validate_roles([{"title": None}, {"location": "London"}, "not a role", {"title": "PM"}])
+
+    assert [r["title"] for r in roles] == ["PM"]
+
+
+# --- scrape_company_roles ---
+
+def test_truncated_reply_is_retried_with_a_larger_budget(scraper, monkeypatch):
+    budgets = []
+
+    def post_chat(payload):
+        budgets.append(payload["max_tokens"])
+        if len(budgets) == 1:
+            raise scraper.TruncatedReply("cut off")
+        return orjson.dumps([_role("PM")]).decode()
+
+    monkeypatch.setattr(scraper, "_post_chat", post_chat)
+
+    roles = scraper.scrape_company_roles("Acme", "https://acme.example.com/careers")
+
+    assert [r["title"] for r in roles] == ["PM"]
+    assert budgets == [scraper.PERPLEXITY_MAX_TOKENS, scraper.PERPLEXITY_RETRY_MAX_TOKENS]
+
+
+# --- scrape_companies_batched ---
+
+def test_batched_reply_is_split_per_company_and_cached(scraper, monkeypatch):
+    calls = []
+
+    def post_chat(payload):
+        calls.append(payload)
+        return orjson.dumps({"Acme": [_role("PM")], "Globex": []}).decode()
+
+    monkeypatch.setattr(scraper, "_post_chat", post_chat)
+
+    results = scraper.scrape_companies_batched(_companies("Acme", "Globex"))
+
+    assert len(calls) == 1
+    assert [r["title"] for r in results["Acme"]["roles"]] == ["PM"]
+    assert results["Globex"] == {"roles": [], "error": None}
+    # Only the non-empty result is cached
+    assert len(sys.modules["db"].saved_scrapes) == 1
+
+
+def test_missing_company_falls_back_and_its_failure_stays_its_own(scraper, monkeypatch):
+    def post_chat(payload):
+        prompt = _user_prompt(payload)
+        if "EACH of these companies" in prompt:
+            return orjson.dumps({"Acme": [_role("PM")]}).decode()
+        assert "Globex" in prompt
+        raise RuntimeError("429 Too Many Requests")
+
+    monkeypatch.setattr(scraper, "_post_chat", post_chat)
+
+    results = scraper.scrape_companies_batched(_companies("Acme", "Globex"))
+
+    assert [r["title"] for r in results["Acme"]["roles"]] == ["PM"]
+    assert results["Acme"]["error"] is None
+    assert results["Globex"] == {"roles": [], "error": "429 Too Many Requests"}
+
+
+def test_array_or_truncated_batch_reply_scrapes_each_company(scraper, monkeypatch):
+    for batch_reply in ([_role("PM")], scraper.TruncatedReply("cut off")):
+        singles = []
+
+        def post_chat(payload):
+            prompt = _user_prompt(payload)
+            if "EACH of these companies" in prompt:
+                if isinstance(batch_reply, Exception):
+                    raise batch_reply
+                return orjson.dumps(batch_reply).decode()
+            singles.append(prompt)
+            return orjson.dumps([_role("Analyst")]).decode()
+
+        monkeypatch.setattr(scraper, "_post_chat", post_chat)
+
+        results = scraper.scrape_companies_batched(_companies("Acme", "Globex"))
+
+        assert len(singles) == 2
+        assert all([r["title"] for r in entry["roles"]] == ["Analyst"] for entry in results.values())
+
+
+# --- scrape_all_companies ---
+
+def test_shared_careers_url_is_scraped_once(scraper, monkeypatch):
+    calls = []
+
+    def post_chat(payload):
+        calls.append(_user_prompt(payload))
+        return orjson.dumps([_role("PM")]).decode()
+
+    monkeypatch.setattr(scraper, "_post_chat", post_chat)
+    companies = _companies("Acme", "Acme Labs", url="https://acme.example.com/careers")
+
+    results = scraper.scrape_all_companies(companies)
+
+    assert len(calls) == 1
+    assert set(results) == {1, 2}
+    assert all([r["title"] for r in outcome["roles"]] == ["PM"] for outcome in results.values())
+
+
+def test_sink_receives_roles_and_its_errors_are_per_company(scraper, monkeypatch):
+    monkeypatch.setattr(scraper, "PERPLEXITY_BATCH_SIZE", 1)
+    monkeypatch.setattr(scraper, "_post_chat", lambda payload: orjson.dumps([_role("PM")]).decode())
+    persisted = {}
+
+    def sink(company, roles):
+        if company["name"] == "Globex":
+            raise RuntimeError("DB down")
+        persisted[company["id"]] = roles
+
+    results = scraper.scrape_all_companies(_companies("Acme", "Globex"), sink=sink)
+
+    assert [r["title"] for r in persisted[1]] == ["PM"]
+    assert results[1] == {"company": _companies("Acme")[0], "error": None}
+    assert results[2]["error"] == "DB down"
+    assert "roles" not in results[2]